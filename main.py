@@ -3,169 +3,423 @@ FastAPI application with GET and PATCH endpoints for
 organization datasource connections.
 """
 
-from re import A
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Union
-from uuid import uuid4
+import threading
+from dataclasses import dataclass, replace
+from hashlib import blake2b
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Union
 
-from fastapi import FastAPI, HTTPException, Path
-from pydantic import BaseModel, Field
+import msgspec
+from fastapi import FastAPI, HTTPException, Path, Request
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
 
 # ─── App ──────────────────────────────────────────────────────────────────────
+# One shared encoder; msgspec codecs are meant to be created once and reused.
+_ENCODER = msgspec.json.Encoder()
+
+
+class MsgspecResponse(JSONResponse):
+    """JSON response rendered with the shared msgspec encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return _ENCODER.encode(content)
+
+
 app = FastAPI(
     title="Test API — Organization Datasource Connections",
     version="0.1.0",
+    default_response_class=MsgspecResponse,
 )
 
+# Route handlers are `async def` and run directly on the event loop: they only
+# touch in-memory state and never block. A handler that gains blocking work
+# (file-backed persistence, a sync HTTP client, ...) must become a plain `def`
+# so Starlette runs it in its threadpool instead of stalling the loop.
+
 
 # ─── Models ───────────────────────────────────────────────────────────────────
-class Credentials(BaseModel):
+# Response structs are read-only once built and hold nothing that can form a
+# reference cycle, so they are frozen and skip GC tracking (`gc=False`).
+class Credentials(
+    msgspec.Struct, frozen=True, forbid_unknown_fields=True, gc=False
+):
     AppName: str
     AppSecret: str
     AppKey: str
     BaseURL: str
 
 
-class FoundryConfig(BaseModel):
+class FoundryConfig(
+    msgspec.Struct, frozen=True, forbid_unknown_fields=True, gc=False
+):
     profiles_dataset_rid: str
     visits_dataset_rid: str
 
 
-class ConnectionResponse(BaseModel):
+# Stored record, GET response body and OpenAPI schema in one. Records are
+# immutable: an update swaps in a new record (copy-on-write).
+@dataclass(frozen=True, slots=True)
+class Connection:
+    """A connection's credentials, Foundry config and last sync timestamp."""
+
     id: str
     credentials: Credentials
     foundry_config: FoundryConfig
     lastSyncAt: Optional[str] = None
 
 
-class PatchConnectionRequest(BaseModel):
-    lastSyncAt: Union[datetime, str] = Field(
-        ...,
-        description="ISO-8601 timestamp of the most recent sync (datetime or string).",
-    )
+# Bounded so the PATCH decoder rejects oversized timestamps while parsing.
+_Timestamp = Annotated[str, msgspec.Meta(max_length=64)]
 
-    def lastSyncAt_iso(self) -> str:
-        """Always return an ISO-8601 string regardless of input type."""
-        if isinstance(self.lastSyncAt, datetime):
-            return self.lastSyncAt.isoformat()
-        return self.lastSyncAt
+
+class PatchConnectionRequest(msgspec.Struct, forbid_unknown_fields=True):
+    """
+    PATCH body. The timestamp may be sent as `last_sync_at` or `lastSyncAt`;
+    exactly one of them is required.
+    """
+
+    last_sync_at: Annotated[
+        Union[_Timestamp, msgspec.UnsetType],
+        msgspec.Meta(description="ISO-8601 timestamp of the most recent sync."),
+    ] = msgspec.UNSET
+    lastSyncAt: Annotated[
+        Union[_Timestamp, msgspec.UnsetType],
+        msgspec.Meta(description="Alias of `last_sync_at`."),
+    ] = msgspec.UNSET
+
+    @property
+    def lastSyncAt_iso(self) -> Optional[str]:
+        """Return the ISO-8601 timestamp exactly as sent by the client."""
+        if isinstance(self.last_sync_at, str):
+            return self.last_sync_at
+        if isinstance(self.lastSyncAt, str):
+            return self.lastSyncAt
+        return None
 
 
-class PatchConnectionResponse(BaseModel):
+class PatchConnectionResponse(
+    msgspec.Struct, frozen=True, forbid_unknown_fields=True, gc=False
+):
     id: str
     lastSyncAt: str
     message: str
 
 
+# Compiled once; decoding a PATCH body reuses the prepared type information.
+_PATCH_DECODER = msgspec.json.Decoder(PatchConnectionRequest)
+
+
+# ─── OpenAPI ──────────────────────────────────────────────────────────────────
+# FastAPI only introspects pydantic models, so the msgspec schemas are
+# generated here and merged into the document FastAPI builds.
+(
+    _CONNECTION_LIST_SCHEMA,
+    _CONNECTION_SCHEMA,
+    _PATCH_REQUEST_SCHEMA,
+    _PATCH_RESPONSE_SCHEMA,
+), _SCHEMA_COMPONENTS = msgspec.json.schema_components(
+    (
+        List[Connection],
+        Connection,
+        PatchConnectionRequest,
+        PatchConnectionResponse,
+    ),
+    ref_template="#/components/schemas/{name}",
+)
+
+# msgspec can't express "exactly one of these two optional fields", which
+# `patch_connection` enforces; publish it so `/docs` doesn't accept `{}`.
+_SCHEMA_COMPONENTS["PatchConnectionRequest"]["oneOf"] = [
+    {"required": ["last_sync_at"]},
+    {"required": ["lastSyncAt"]},
+]
+
+
+def _json_content(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"application/json": {"schema": schema}}
+
+
+def _openapi() -> Dict[str, Any]:
+    if app.openapi_schema is None:
+        schema = FastAPI.openapi(app)
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(
+            _SCHEMA_COMPONENTS
+        )
+    assert app.openapi_schema is not None  # set by FastAPI.openapi above
+    return app.openapi_schema
+
+
+# Overriding `app.openapi` is FastAPI's documented way to extend the schema.
+app.openapi = _openapi  # type: ignore[method-assign]
+
+
 # ─── In-memory data store (dummy data) ───────────────────────────────────────
-DUMMY_CONNECTIONS: Dict[str, Dict[str, Any]] = {
-    "conn_001": {
-        "id": "conn_001",
-        "credentials": {
-            "AppName": "Perry",
-            "AppSecret": "876442f4-6468-4f0e-bbbe-c97f82aa1e86",
-            "AppKey": "MQAwADMANwA4ADEANwAtADIARQA0ADQAQgBEAEQAOQA1ADIAOQA1ADQAQQBGAEYARAA3ADkAMQBCADgARQBCADUANQBDADgAOABEAA==",
-            "BaseURL": "https://cloud.hhaexchange.com",
-        },
-        "foundry_config": {
-            "profiles_dataset_rid": "ri.foundry.main.dataset.11c3e68b-7bfc-4783-82df-a8865663ca8b",
-            "visits_dataset_rid": "ri.foundry.main.dataset.57a68f07-1a41-43ea-a188-3611d68f83c5",
-        },
-        "lastSyncAt": None,
-    },
-    "conn_002": {
-        "id": "conn_002",
-        "credentials": {
-            "AppName": "Perry", #Mulberry Street
-            "AppSecret": "443ac9ad-6ac6-4c8f-855b-6460b3d99288",
-            "AppKey": "MQA2ADQANQA4ADcALQA3AEYARQA0ADAANAA2ADkAOABGADgANgA5AEIAMQBCAEUARQBGAEEAOQA5ADYANwBGADkANgA4ADcAMwA=",
-            "BaseURL": "https://app2.hhaexchange.com",
-        },
-        "foundry_config": {
-            "profiles_dataset_rid": "ri.foundry.main.dataset.a64b4790-85ba-49ef-b320-d077ac044637",
-            "visits_dataset_rid": "ri.foundry.main.dataset.dec9dedd-23f5-4a15-ba7d-672226944caf",
-        },
-        "lastSyncAt": "2026-02-16T08:30:00+00:00",
-    },
+DUMMY_CONNECTIONS: Dict[str, Connection] = {
+    "conn_001": Connection(
+        id="conn_001",
+        credentials=Credentials(
+            AppName="Perry",
+            AppSecret="876442f4-6468-4f0e-bbbe-c97f82aa1e86",
+            AppKey="MQAwADMANwA4ADEANwAtADIARQA0ADQAQgBEAEQAOQA1ADIAOQA1ADQAQQBGAEYARAA3ADkAMQBCADgARQBCADUANQBDADgAOABEAA==",
+            BaseURL="https://cloud.hhaexchange.com",
+        ),
+        foundry_config=FoundryConfig(
+            profiles_dataset_rid="ri.foundry.main.dataset.11c3e68b-7bfc-4783-82df-a8865663ca8b",
+            visits_dataset_rid="ri.foundry.main.dataset.57a68f07-1a41-43ea-a188-3611d68f83c5",
+        ),
+        lastSyncAt=None,
+    ),
+    "conn_002": Connection(
+        id="conn_002",
+        credentials=Credentials(
+            AppName="Perry", #Mulberry Street
+            AppSecret="443ac9ad-6ac6-4c8f-855b-6460b3d99288",
+            AppKey="MQA2ADQANQA4ADcALQA3AEYARQA0ADAANAA2ADkAOABGADgANgA5AEIAMQBCAEUARQBGAEEAOQA5ADYANwBGADkANgA4ADcAMwA=",
+            BaseURL="https://app2.hhaexchange.com",
+        ),
+        foundry_config=FoundryConfig(
+            profiles_dataset_rid="ri.foundry.main.dataset.a64b4790-85ba-49ef-b320-d077ac044637",
+            visits_dataset_rid="ri.foundry.main.dataset.dec9dedd-23f5-4a15-ba7d-672226944caf",
+        ),
+        lastSyncAt="2026-02-16T08:30:00+00:00",
+    ),
 }
 
+# Shared 404 for unknown IDs, so a miss allocates neither a detail string nor
+# an exception. Raise it with `.with_traceback(None)`: re-raising one instance
+# otherwise keeps appending to its traceback. `_handle_http_exception` below
+# clears its traceback and context once the 404 is rendered, so the instance
+# does not keep the failed request's frames alive between misses.
+_NOT_FOUND = HTTPException(status_code=404, detail="Connection not found.")
+
+
+@app.exception_handler(HTTPException)
+async def _handle_http_exception(request: Request, exc: HTTPException) -> Response:
+    """
+    Default HTTPException handling, plus: once the shared 404 has been turned
+    into a response, drop its traceback and context so it does not keep the
+    failed request's frames (request, decoded payload) alive until the next
+    miss.
+    """
+    try:
+        return await http_exception_handler(request, exc)
+    finally:
+        if exc is _NOT_FOUND:
+            exc.__traceback__ = None
+            exc.__context__ = None
+
+
+def _encode_cached(obj: Any) -> Tuple[str, bytes]:
+    """
+    Encode `obj` into an `(etag, body)` pair. The ETag is a digest of the body,
+    so it names the same bytes in every process and across restarts and
+    clients can revalidate with `If-None-Match` to get a 304.
+    """
+    body = _ENCODER.encode(obj)
+    return f'"{blake2b(body, digest_size=16).hexdigest()}"', body
+
+
+# Serialized payloads as `(etag, body)` pairs. DUMMY_CONNECTIONS is trusted
+# in-process data, so everything is encoded once at import time and
+# re-encoded by `patch_connection` after a write.
+_ITEM_CACHE: Dict[str, Tuple[str, bytes]] = {
+    cid: _encode_cached(c) for cid, c in DUMMY_CONNECTIONS.items()
+}
+_LIST_CACHE: Tuple[str, bytes] = _encode_cached(list(DUMMY_CONNECTIONS.values()))
+
+# Readers never lock: writers only ever rebind whole values (a new record,
+# a new `(etag, body)` pair), so a reader sees either the old or the new one.
+# The lock just serialises writers so the list payload always reflects every
+# committed write, including on free-threaded builds.
+_WRITE_LOCK = threading.Lock()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of `If-None-Match` against `etag` (RFC 9110 §13.1.2): the
+    header may list several tags or be `*`, and a `W/` prefix is ignored, e.g.
+    when a compressing proxy has weakened our strong tag.
+    """
+    if if_none_match is None:
+        return False
+    opaque = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def _cached_json(request: Request, cached: Tuple[str, bytes]) -> Response:
+    """Return a cached payload, or an empty 304 if the client's copy is current."""
+    etag, content = cached
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
 
 # ─── GET endpoint ─────────────────────────────────────────────────────────────
 @app.get(
     "/backend/datasources/organizations/connections",
-    response_model=List[ConnectionResponse],
+    responses={200: {"content": _json_content(_CONNECTION_LIST_SCHEMA)}},
     summary="List all organisation datasource connections",
 )
-async def get_connections():
+async def get_connections(request: Request) -> Response:
     """
     Return every connection with its credentials, Foundry config,
     and the timestamp of the most recent sync (if any).
     """
-    return list(DUMMY_CONNECTIONS.values())
+    return _cached_json(request, _LIST_CACHE)
+
+
+# ─── GET by ID: known IDs ────────────────────────────────────────────────────
+# The store's key set is fixed and tiny, so every known ID gets its own
+# literal route. These are registered ahead of the parametrised route below,
+# so they match first and skip the path-parameter conversion.
+def _known_connection_endpoint(connection_id: str):
+    async def get_known_connection(request: Request) -> Response:
+        return _cached_json(request, _ITEM_CACHE[connection_id])
+
+    return get_known_connection
+
+
+for _connection_id in DUMMY_CONNECTIONS:
+    app.add_api_route(
+        f"/backend/datasources/organizations/connections/{_connection_id}",
+        _known_connection_endpoint(_connection_id),
+        methods=["GET"],
+        include_in_schema=False,
+    )
 
 
 # ─── GET by ID endpoint ──────────────────────────────────────────────────────
 @app.get(
     "/backend/datasources/organizations/connections/{organization_datasource_id}",
-    response_model=ConnectionResponse,
+    responses={200: {"content": _json_content(_CONNECTION_SCHEMA)}},
     summary="Get a single connection by ID",
 )
 async def get_connection_by_id(
+    request: Request,
     organization_datasource_id: str = Path(
         ..., description="ID of the connection to retrieve"
     ),
-):
+) -> Response:
     """
     Return a single connection's credentials, Foundry config,
     and last sync timestamp.
 
     This is the endpoint consumed by `get_connection_details()`.
     """
-    connection = DUMMY_CONNECTIONS.get(organization_datasource_id)
-    if connection is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Connection '{organization_datasource_id}' not found.",
-        )
-    return connection
+    # Known IDs are served by the literal routes above, so this route mostly
+    # sees misses: a plain `.get()` avoids raising a KeyError for each one.
+    cached = _ITEM_CACHE.get(organization_datasource_id)
+    if cached is None:
+        raise _NOT_FOUND.with_traceback(None)
+    return _cached_json(request, cached)
 
 
 # ─── PATCH endpoint ──────────────────────────────────────────────────────────
+def _body_error(
+    error_type: str, loc: Tuple[str, ...], msg: str
+) -> RequestValidationError:
+    """Build a 422 with FastAPI's `HTTPValidationError` shape for the body."""
+    return RequestValidationError(
+        [{"type": error_type, "loc": ("body", *loc), "msg": msg}]
+    )
+
+
+def _decode_error(exc: msgspec.DecodeError) -> RequestValidationError:
+    """Map a msgspec error such as "Expected `str` - at `$.lastSyncAt`"."""
+    msg, _, path = str(exc).partition(" - at `$")
+    loc = tuple(path.rstrip("`").lstrip(".").split(".")) if path else ()
+    if isinstance(exc, msgspec.ValidationError):
+        return _body_error("value_error", loc, msg)
+    return _body_error("json_invalid", loc, msg)
+
+
 @app.patch(
     "/backend/datasources/organizations/connections/{organization_datasource_id}",
-    response_model=PatchConnectionResponse,
+    responses={200: {"content": _json_content(_PATCH_RESPONSE_SCHEMA)}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": _json_content(_PATCH_REQUEST_SCHEMA),
+        }
+    },
     summary="Update lastSyncAt for a connection",
 )
 async def patch_connection(
-    payload: PatchConnectionRequest,
+    request: Request,
     organization_datasource_id: str = Path(
         ..., description="ID of the connection to update"
     ),
-):
+) -> Response:
     """
     Accept a JSON body with `lastSyncAt` (ISO-8601 string) and
     persist it against the given connection ID.
 
     This is the endpoint consumed by `update_connection_status()`.
     """
-    connection = DUMMY_CONNECTIONS.get(organization_datasource_id)
-    if connection is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Connection '{organization_datasource_id}' not found.",
+    global _LIST_CACHE
+
+    # The body is decoded straight into the msgspec struct instead of going
+    # through FastAPI's pydantic body binding.
+    try:
+        payload = _PATCH_DECODER.decode(await request.body())
+    except msgspec.DecodeError as exc:
+        raise _decode_error(exc) from None
+    if isinstance(payload.last_sync_at, str) and isinstance(payload.lastSyncAt, str):
+        raise _body_error(
+            "extra_forbidden",
+            ("lastSyncAt",),
+            "Only one of `last_sync_at` and `lastSyncAt` may be set",
         )
+    iso = payload.lastSyncAt_iso
+    if iso is None:
+        raise _body_error("missing", ("last_sync_at",), "Field required")
 
-    connection["lastSyncAt"] = payload.lastSyncAt_iso()
+    try:
+        connection = DUMMY_CONNECTIONS[organization_datasource_id]
+    except KeyError:
+        raise _NOT_FOUND.with_traceback(None) from None
 
-    return PatchConnectionResponse(
-        id=organization_datasource_id,
-        lastSyncAt=payload.lastSyncAt_iso(),
-        message="lastSyncAt updated successfully",
+    with _WRITE_LOCK:
+        connection = replace(connection, lastSyncAt=iso)
+        DUMMY_CONNECTIONS[organization_datasource_id] = connection
+        _ITEM_CACHE[organization_datasource_id] = _encode_cached(connection)
+        _LIST_CACHE = _encode_cached(list(DUMMY_CONNECTIONS.values()))
+
+    return MsgspecResponse(
+        PatchConnectionResponse(
+            id=organization_datasource_id,
+            lastSyncAt=iso,
+            message="lastSyncAt updated successfully",
+        )
     )
 
 
 # ─── Run ──────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    import os
+
     import uvicorn
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # `RELOAD=1 python main.py` for local development (access log on);
+    # otherwise uvloop + httptools with the access log off. The store lives in
+    # process memory, so the default is a single worker: with more, each
+    # worker holds its own copy and a PATCH is only visible on the one that
+    # served it. WEB_CONCURRENCY opts in to multiple workers regardless.
+    reload = os.getenv("RELOAD") == "1"
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        access_log=reload,
+        workers=1 if reload else workers,
+        reload=reload,
+    )